@@ -0,0 +1,405 @@
+r"""
+Offline bulk redaction over local files.
+
+Runs redact_pdf/redact_docx over a directory (or a manifest listing one path
+per line) without Firebase or network access, e.g. for backfills after a
+template change:
+
+    python bulk_redact.py ./documents rules.json ./out --workers 4
+
+The rules file uses the same fields as the Firestore rule documents, either as
+a list or as {"template_id": "...", "rules": [...]}:
+
+    [{"id": "r1", "name": "Email", "type": "regex", "pattern": "\\S+@\\S+"},
+     {"id": "r2", "name": "People", "type": "spacy", "key": "PERSON"}]
+
+Redacted files are written to <out>/redacted/ and reports to <out>/reports/,
+mirroring the input layout. A document counts as done once its report exists
+and was produced by the same rules, so re-running the same command resumes
+after an interruption and re-running with changed rules redoes everything.
+"""
+import argparse
+import hashlib
+import json
+import multiprocessing
+import os
+import re
+import signal
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import List, Dict, Any, Tuple
+
+SUPPORTED_EXTENSIONS = (".pdf", ".docx")
+# Each worker holds its own Stanza pipeline, so keep the default pool small
+DEFAULT_MAX_WORKERS = 4
+
+# Per-worker state, populated once by _init_worker
+_worker_rules = None
+_worker_template_id = None
+_worker_rules_hash = None
+
+def load_rules(rules_path: str) -> Tuple[List[Dict[str, Any]], str]:
+    """
+    Load and validate a JSON rules file.
+
+    Args:
+        rules_path (str): Path to a rules list or {"template_id": ..., "rules": [...]}
+
+    Returns:
+        tuple: Prepared rules and the template id
+
+    Raises:
+        ValueError: If the file yields no usable rules or a regex does not compile
+    """
+    from utils.redaction import prepare_rules
+    with open(rules_path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    if isinstance(data, dict):
+        rules_data = data.get("rules", [])
+        template_id = data.get("template_id", "bulk")
+    else:
+        rules_data = data
+        template_id = "bulk"
+    rules = prepare_rules(rules_data)
+    if not rules:
+        raise ValueError(f"No usable rules in {rules_path}")
+    for rule in rules:
+        if rule["type"] == "regex":
+            try:
+                re.compile(rule["value"])
+            except re.error as e:
+                raise ValueError(f"Invalid regex in rule {rule['rule_id']} ({rule['name']}): {e}")
+    return rules, template_id
+
+def rules_fingerprint(rules: List[Dict[str, Any]], template_id: str) -> str:
+    payload = json.dumps({"template_id": template_id, "rules": rules}, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+def _is_within(path: str, directory: str) -> bool:
+    path = os.path.realpath(path)
+    return path == directory or path.startswith(directory + os.sep)
+
+def collect_inputs(source: str, out_dir: str | None = None) -> List[Tuple[str, str]]:
+    """
+    Resolve the input source into (absolute path, relative path) pairs.
+
+    Args:
+        source (str): A directory to walk, or a manifest file with one path per line
+        out_dir (str, optional): Output directory to exclude from the inputs
+
+    Returns:
+        list: Supported documents, sorted by relative path
+    """
+    real_out_dir = os.path.realpath(out_dir) if out_dir else None
+    inputs = []
+    if os.path.isdir(source):
+        for root, dirs, files in os.walk(source):
+            if real_out_dir:
+                # Never pick up our own redacted files as new inputs
+                dirs[:] = [d for d in dirs if not _is_within(os.path.join(root, d), real_out_dir)]
+            for filename in files:
+                if os.path.splitext(filename)[1].lower() in SUPPORTED_EXTENSIONS:
+                    path = os.path.join(root, filename)
+                    inputs.append((os.path.abspath(path), os.path.relpath(path, source)))
+    else:
+        base_dir = os.path.dirname(os.path.abspath(source))
+        seen_paths = set()
+        seen_rel_paths = set()
+        with open(source, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line or line.startswith("#"):
+                    continue
+                path = line if os.path.isabs(line) else os.path.join(base_dir, line)
+                if os.path.splitext(path)[1].lower() not in SUPPORTED_EXTENSIONS:
+                    print(f"Skipping unsupported file type: {line}")
+                    continue
+                if real_out_dir and _is_within(path, real_out_dir):
+                    print(f"Skipping file inside the output directory: {line}")
+                    continue
+                real_path = os.path.realpath(path)
+                if real_path in seen_paths:
+                    print(f"Skipping duplicate manifest entry: {line}")
+                    continue
+                rel_path = os.path.normpath(os.path.relpath(path, base_dir))
+                if rel_path.startswith(os.pardir):
+                    # Keep outputs for paths outside the manifest directory inside out_dir
+                    rel_path = os.path.join("_external", os.path.abspath(path).lstrip(os.sep))
+                if rel_path in seen_rel_paths:
+                    print(f"Skipping manifest entry whose outputs would clash with another entry: {line}")
+                    continue
+                seen_paths.add(real_path)
+                seen_rel_paths.add(rel_path)
+                inputs.append((os.path.abspath(path), rel_path))
+    return sorted(inputs, key=lambda item: item[1])
+
+def output_paths(out_dir: str, rel_path: str) -> Tuple[str, str]:
+    stem, ext = os.path.splitext(rel_path)
+    redacted_path = os.path.join(out_dir, "redacted", stem + "_redacted" + ext)
+    report_path = os.path.join(out_dir, "reports", rel_path + ".json")
+    return redacted_path, report_path
+
+def is_done(report_path: str, rules_hash: str) -> bool:
+    try:
+        with open(report_path, "r", encoding="utf-8") as f:
+            return json.load(f).get("rules_hash") == rules_hash
+    except (OSError, ValueError):
+        return False
+
+def _write_atomic(path: str, data: bytes) -> None:
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=os.path.basename(path) + ".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+def check_imports() -> None:
+    """
+    Verify once in the parent that the redaction modules import.
+
+    Raises:
+        RuntimeError: If a redaction dependency is missing
+    """
+    try:
+        import utils.redaction  # noqa: F401
+        import utils.docx_redaction  # noqa: F401
+    except ImportError as e:
+        raise RuntimeError(f"Cannot import redaction modules: {e}")
+
+def check_ner_model(rules: List[Dict[str, Any]], allow_download: bool) -> None:
+    """
+    Verify once in the parent that workers will be able to load the NER model.
+
+    Args:
+        rules (list): Prepared rules
+        allow_download (bool): Download the Stanza model first if it is not cached
+
+    Raises:
+        RuntimeError: If the model is needed and cannot be loaded from the local cache
+    """
+    if not any(r["type"] == "spacy" for r in rules):
+        return
+    import stanza
+    from utils.ner import NERProcessor
+    try:
+        if allow_download:
+            # Download here once so workers don't race on the same resources directory
+            stanza.download('en')
+        NERProcessor(offline=True)
+    except Exception as e:
+        hint = "" if allow_download else " (use --allow-download to fetch it)"
+        raise RuntimeError(f"Cannot load the Stanza NER model from the local cache{hint}: {e}")
+
+def _init_worker(rules: List[Dict[str, Any]], template_id: str, rules_hash: str, out_dir: str) -> None:
+    global _worker_rules, _worker_template_id, _worker_rules_hash
+    # Ctrl-C is handled by the parent, which cancels queued documents
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    # The redaction modules print rules, matches and document text; keep that out of the
+    # progress output but next to the reports, which hold the same text
+    log_dir = os.path.join(out_dir, "logs")
+    os.makedirs(log_dir, exist_ok=True)
+    sys.stdout = open(os.path.join(log_dir, f"worker-{os.getpid()}.log"), "a", encoding="utf-8", buffering=1)
+    # The parent already made sure the model is cached
+    os.environ["NER_OFFLINE"] = "1"
+    # A failed NER pass must fail the document rather than leave it under-redacted
+    os.environ["NER_STRICT"] = "1"
+    # Import once per worker so models and rule objects are reused across documents
+    from utils.redaction import RedactionRule as PDFRedactionRule
+    from utils.docx_redaction import RedactionRule as DocxRedactionRule
+    _worker_rules = {
+        ".pdf": [PDFRedactionRule(r["type"], r["value"], r["name"], r["rule_id"], r["is_ai_detected"]) for r in rules],
+        ".docx": [DocxRedactionRule(r["type"], r["value"], r["name"], r["rule_id"], r["is_ai_detected"]) for r in rules],
+    }
+    _worker_template_id = template_id
+    _worker_rules_hash = rules_hash
+    if any(r["type"] == "spacy" for r in rules):
+        from utils.ner import get_ner_processor
+        get_ner_processor()
+
+def redact_file(path: str, rel_path: str, out_dir: str) -> Dict[str, Any]:
+    """
+    Redact a single local file and write the redacted copy and its report.
+
+    Args:
+        path (str): Absolute path of the input document
+        rel_path (str): Path relative to the input root, used for the output layout
+        out_dir (str): Output directory
+
+    Returns:
+        dict: Outcome with status, byte count, redaction count and elapsed seconds
+    """
+    from utils.redaction import redact_pdf
+    from utils.docx_redaction import redact_docx
+    started = time.perf_counter()
+    ext = os.path.splitext(path)[1].lower()
+    try:
+        with open(path, "rb") as f:
+            doc_bytes = f.read()
+        if ext == ".pdf":
+            result = redact_pdf(doc_bytes, _worker_rules[ext], _worker_template_id)
+            file_bytes = result["redacted_pdf"]
+        elif ext == ".docx":
+            result = redact_docx(doc_bytes, _worker_rules[ext], _worker_template_id)
+            file_bytes = result["redacted_docx"]
+        else:
+            raise ValueError(f"Unsupported file type: {ext}")
+        report = result["report"]
+        redacted_path, report_path = output_paths(out_dir, rel_path)
+        report_doc = {
+            "original_path": path,
+            "original_filename": os.path.basename(path),
+            "redacted_filename": os.path.basename(redacted_path),
+            "template_id": _worker_template_id,
+            "rules_hash": _worker_rules_hash,
+            "original_text": report["before_text"],
+            "redacted_text": report["after_text"],
+            "total_redactions": report["total_redactions"],
+            "redactions": report["redactions"],
+            "report": report,
+        }
+        _write_atomic(redacted_path, file_bytes)
+        # The report is written last and marks the document as done for resume
+        _write_atomic(report_path, json.dumps(report_doc, ensure_ascii=False, indent=2).encode("utf-8"))
+        return {
+            "path": rel_path,
+            "status": "redacted",
+            "bytes": len(doc_bytes),
+            "total_redactions": report["total_redactions"],
+            "seconds": time.perf_counter() - started,
+        }
+    except Exception as e:
+        return _failed(rel_path, str(e), time.perf_counter() - started)
+
+def _failed(rel_path: str, error: str, seconds: float = 0.0) -> Dict[str, Any]:
+    return {
+        "path": rel_path,
+        "status": "failed",
+        "error": error,
+        "bytes": 0,
+        "total_redactions": 0,
+        "seconds": seconds,
+    }
+
+def _print_stats(stats: Dict[str, Any], done: int, total: int, elapsed: float) -> None:
+    rate = stats["redacted"] / elapsed if elapsed > 0 else 0.0
+    mb_rate = stats["bytes"] / (1024 * 1024) / elapsed if elapsed > 0 else 0.0
+    print(f"[{done}/{total}] redacted={stats['redacted']} failed={stats['failed']} "
+          f"redactions={stats['total_redactions']} elapsed={elapsed:.1f}s "
+          f"throughput={rate:.2f} docs/s, {mb_rate:.2f} MB/s")
+
+def run(source: str, rules: List[Dict[str, Any]], template_id: str, out_dir: str, workers: int,
+        resume: bool = True) -> Dict[str, Any]:
+    rules_hash = rules_fingerprint(rules, template_id)
+    inputs = collect_inputs(source, out_dir)
+    pending = []
+    skipped = 0
+    for path, rel_path in inputs:
+        _, report_path = output_paths(out_dir, rel_path)
+        if resume and is_done(report_path, rules_hash):
+            skipped += 1
+            continue
+        pending.append((path, rel_path))
+    print(f"Found {len(inputs)} documents, {skipped} already done, {len(pending)} to redact with {workers} workers")
+
+    stats = {"redacted": 0, "failed": 0, "skipped": skipped, "bytes": 0, "total_redactions": 0, "failures": [],
+             "interrupted": False}
+    started = time.perf_counter()
+    if pending:
+        # Spawn keeps fitz/stanza state out of forked children
+        ctx = multiprocessing.get_context("spawn")
+        executor = ProcessPoolExecutor(max_workers=workers, mp_context=ctx, initializer=_init_worker,
+                                       initargs=(rules, template_id, rules_hash, out_dir))
+        futures = {}
+        done = 0
+        try:
+            for path, rel_path in pending:
+                futures[executor.submit(redact_file, path, rel_path, out_dir)] = rel_path
+            for future in as_completed(futures):
+                done += 1
+                try:
+                    result = future.result()
+                except Exception as e:
+                    # A crashed worker (segfault, OOM kill, failed initializer) breaks the pool;
+                    # every outstanding document ends up here and is retried on the next run
+                    result = _failed(futures[future], f"{type(e).__name__}: {e}")
+                stats[result["status"]] += 1
+                stats["bytes"] += result["bytes"]
+                stats["total_redactions"] += result["total_redactions"]
+                if result["status"] == "failed":
+                    stats["failures"].append({"path": result["path"], "error": result["error"]})
+                    print(f"Failed to redact {result['path']}: {result['error']}")
+                if done % 10 == 0 or done == len(pending):
+                    _print_stats(stats, done, len(pending), time.perf_counter() - started)
+        except KeyboardInterrupt:
+            # Drop queued documents; only the ones already running finish, and their writes are atomic.
+            # Cancel here as well: the executor can be collected before its manager thread gets to it
+            stats["interrupted"] = True
+            for future in futures:
+                future.cancel()
+            executor.shutdown(wait=False, cancel_futures=True)
+            _print_stats(stats, done, len(pending), time.perf_counter() - started)
+        else:
+            executor.shutdown(wait=True)
+    stats["seconds"] = time.perf_counter() - started
+    return stats
+
+def main(argv: List[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Redact local PDF/DOCX files offline using a JSON rules file.")
+    parser.add_argument("source", help="Input directory, or a manifest file with one document path per line")
+    parser.add_argument("rules", help="JSON rules file")
+    parser.add_argument("out_dir", help="Output directory for redacted files and reports")
+    parser.add_argument("--workers", type=int, default=min(DEFAULT_MAX_WORKERS, os.cpu_count() or 1),
+                        help="Number of worker processes; each loads its own NER model (default: %(default)s)")
+    parser.add_argument("--no-resume", action="store_true", help="Redact every document even if its report already exists")
+    parser.add_argument("--allow-download", action="store_true", help="Allow downloading the Stanza model if it is not cached")
+    args = parser.parse_args(argv)
+
+    if not os.path.exists(args.source):
+        parser.error(f"source not found: {args.source}")
+    if not os.path.isfile(args.rules):
+        parser.error(f"rules file not found: {args.rules}")
+    try:
+        check_imports()
+    except RuntimeError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 2
+    try:
+        rules, template_id = load_rules(args.rules)
+    except ValueError as e:
+        # json.JSONDecodeError is a ValueError too
+        parser.error(f"invalid rules file {args.rules}: {e}")
+    try:
+        check_ner_model(rules, args.allow_download)
+    except RuntimeError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 2
+
+    failures_path = os.path.join(args.out_dir, "failures.json")
+    if os.path.exists(failures_path):
+        # Don't leave failures from an earlier run behind after a clean re-run
+        os.remove(failures_path)
+
+    stats = run(args.source, rules, template_id, args.out_dir, max(1, args.workers), resume=not args.no_resume)
+    if stats["interrupted"]:
+        print("Interrupted; re-run the same command to resume")
+    print(f"Done: redacted={stats['redacted']} failed={stats['failed']} skipped={stats['skipped']} "
+          f"in {stats['seconds']:.1f}s")
+    if stats["failures"]:
+        os.makedirs(args.out_dir, exist_ok=True)
+        with open(failures_path, "w", encoding="utf-8") as f:
+            json.dump(stats["failures"], f, indent=2)
+        print(f"Failures written to {failures_path}")
+    if stats["interrupted"]:
+        return 130
+    return 1 if stats["failures"] else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
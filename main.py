@@ -5,7 +5,7 @@ from typing import List, Dict, Any
 import mimetypes
 import os
 from dotenv import load_dotenv
-from utils.redaction import fetch_document, redact_pdf, RedactionRule as PDFRedactionRule
+from utils.redaction import fetch_document, redact_pdf, prepare_rules, RedactionRule as PDFRedactionRule
 from utils.docx_redaction import redact_docx, RedactionRule as DocxRedactionRule
 from utils.firebase import upload_file_to_firebase, fetch_document_by_id, fetch_template_by_id, fetch_rules_by_ids, save_redaction_response, update_document_status, fetch_redaction_response
 from utils.gemini import find_text_to_redact
@@ -162,15 +162,7 @@ async def redact_document(request: RedactRequest):
         rule_ids = template_data.get("ruleIds", [])
         rules_data = fetch_rules_by_ids(rule_ids)
         # Prepare rules for redaction
-        rules = []
-        for r in rules_data:
-            print(r)
-            rule_type = r.get("type")
-            value = r.get("pattern") if rule_type != "spacy" else r.get("key")
-            name = r.get("name", "Unnamed Rule")
-            rule_id = r.get("id", "No ID")
-            if rule_type and value:
-                rules.append({"type": rule_type, "value": value, "name": name, "rule_id": rule_id, "is_ai_detected": False})
+        rules = prepare_rules(rules_data)
         # Fetch document from URL
         document_url = doc_data.get("url")
         if not document_url:
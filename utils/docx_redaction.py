@@ -2,10 +2,7 @@ from typing import List, Dict, Any
 from docx import Document
 import re
 from io import BytesIO
-from utils.ner import NERProcessor
-
-# Initialize NER processor
-ner_processor = NERProcessor()
+from utils.ner import get_ner_processor
 
 class RedactionRule:
     def __init__(self, type_: str, value: str, name: str, rule_id: str, is_ai_detected: bool):
@@ -26,6 +23,8 @@ def getSpacyText(text, value):
     Returns:
         list: List of extracted entities
     """
+    # Load the model outside the try so a load failure is not mistaken for "no entities"
+    ner_processor = get_ner_processor()
     try:
         entities = ner_processor.extract_entities(text)
         # Filter entities by type if specified
@@ -36,6 +35,8 @@ def getSpacyText(text, value):
             entities = [ent for ent in entities if ent['type'].lower() in [t.lower() for t in entity_types]]
         return [ent['text'] for ent in entities]
     except Exception as e:
+        if ner_processor.strict:
+            raise
         print(f"Error in getSpacyText: {e}")
         return []
 
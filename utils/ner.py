@@ -1,8 +1,24 @@
+import os
 import stanza
+from functools import lru_cache
 from typing import List, Dict, Any
 
 class NERProcessor:
-    def __init__(self):
+    def __init__(self, offline: bool | None = None, strict: bool | None = None):
+        if offline is None:
+            offline = os.getenv("NER_OFFLINE", "").lower() in ("1", "true", "yes")
+        if strict is None:
+            strict = os.getenv("NER_STRICT", "").lower() in ("1", "true", "yes")
+        # In strict mode NER errors are raised instead of returning no entities
+        self.strict = strict
+        # Entities of the last text; redaction asks for the same document text per page/paragraph and rule
+        self._last_text = None
+        self._last_entities = None
+        if offline:
+            # Use the locally cached model only, never touch the network
+            self.nlp = stanza.Pipeline(lang='en', processors='tokenize,ner', download_method=None)
+            return
+
         # Download the English model if not already downloaded
         try:
             stanza.download('en')
@@ -22,6 +38,8 @@ class NERProcessor:
         Returns:
             List[Dict[str, Any]]: List of entities with their text and type
         """
+        if text == self._last_text:
+            return list(self._last_entities)
         try:
             doc = self.nlp(text)
             entities = []
@@ -32,11 +50,25 @@ class NERProcessor:
                     "type": ent.type
                 })
             print(entities)
-            return entities
+            self._last_text = text
+            self._last_entities = entities
+            return list(entities)
         except Exception as e:
+            if self.strict:
+                raise
             print(f"Error processing text with NER: {e}")
             return []
 
+@lru_cache(maxsize=None)
+def get_ner_processor() -> NERProcessor:
+    """
+    Return the process-wide NER processor, loading the Stanza model on first use.
+
+    Returns:
+        NERProcessor: Shared processor instance for this process
+    """
+    return NERProcessor()
+
 # Example usage
 if __name__ == "__main__":
     # Initialize the NER processor
@@ -2,10 +2,7 @@ import fitz  # PyMuPDF
 import requests
 import re
 from typing import List, Dict, Any
-from utils.ner import NERProcessor
-
-# Initialize NER processor
-ner_processor = NERProcessor()
+from utils.ner import get_ner_processor
 
 class RedactionRule:
     def __init__(self, type_: str, value: str, name: str, rule_id: str, is_ai_detected: bool):
@@ -15,6 +12,34 @@ class RedactionRule:
         self.rule_id = rule_id
         self.is_ai_detected = is_ai_detected
 
+SUPPORTED_RULE_TYPES = ("text", "regex", "spacy")
+
+def prepare_rules(rules_data: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Convert stored rule documents into the rule dicts used for redaction.
+
+    Args:
+        rules_data (list): Rule documents with type, pattern/key, name and id
+
+    Returns:
+        list: Rules with type, value, name, rule_id and is_ai_detected
+    """
+    rules = []
+    for r in rules_data:
+        rule_type = r.get("type")
+        value = r.get("pattern") if rule_type != "spacy" else r.get("key")
+        name = r.get("name", "Unnamed Rule")
+        rule_id = r.get("id", "No ID")
+        if rule_type not in SUPPORTED_RULE_TYPES:
+            print(f"Skipping rule {rule_id} ({name}): unknown type {rule_type!r}")
+            continue
+        if not value:
+            field = "key" if rule_type == "spacy" else "pattern"
+            print(f"Skipping rule {rule_id} ({name}): missing '{field}'")
+            continue
+        rules.append({"type": rule_type, "value": value, "name": name, "rule_id": rule_id, "is_ai_detected": False})
+    return rules
+
 def fetch_document(url: str) -> bytes:
     response = requests.get(url)
     response.raise_for_status()
@@ -31,6 +56,8 @@ def getSpacyText(text, value):
     Returns:
         list: List of extracted entities
     """
+    # Load the model outside the try so a load failure is not mistaken for "no entities"
+    ner_processor = get_ner_processor()
     try:
         entities = ner_processor.extract_entities(text)
         # Filter entities by type if specified
@@ -41,6 +68,8 @@ def getSpacyText(text, value):
             entities = [ent for ent in entities if ent['type'].lower() in [t.lower() for t in entity_types]]
         return [ent['text'] for ent in entities]
     except Exception as e:
+        if ner_processor.strict:
+            raise
         print(f"Error in getSpacyText: {e}")
         return []
 